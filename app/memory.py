@@ -1,5 +1,6 @@
 from pathlib import Path
 import re
+from typing import Optional
 
 
 USER_MEMORY_FILE = Path("USER_MEMORY.md")
@@ -11,21 +12,56 @@ SENSITIVE_PATTERNS = (
     "password", "secret", "ssn", "api_key", "apikey", "token", "credential",
     "social security", "credit card", "pin ", "pii",
 )
+# One alternation pass over the text instead of a substring scan per pattern
+_SENSITIVE_RE = re.compile("|".join(map(re.escape, SENSITIVE_PATTERNS)), re.IGNORECASE)
+# Every pattern starts with one of these letters, so text containing none of them can't match
+_SENSITIVE_LEAD = frozenset(c for p in SENSITIVE_PATTERNS for c in (p[0], p[0].upper()))
+
+_ROLE_RE = re.compile(r"\b(?:i\s+am|i'm)\s+a[n]?\s+(.+?)\s*(?:\.|,|\s+and\s+|$)", re.IGNORECASE)
+_ROLE_SHORT_RE = re.compile(r"\b(?:i\s+am|i'm)\s+(?!a[n]?\s)(.+?)\s*(?:\.|,|\s+and\s+|$)", re.IGNORECASE)
+_PREF_RE = re.compile(r"\b(?:i\s+prefer|i'd\s+prefer)\s+(.+?)\s*(?:\.|,|\s+and\s+|$)", re.IGNORECASE)
+_ORG_RE = re.compile(r"\bour\s+team\s+(.+?)\s*(?:\.|,|$)", re.IGNORECASE)
+_WEAK_RE = re.compile(r"\b(?:i\s+might|i\s+may|i'm\s+thinking|i\s+could)\s+.+", re.IGNORECASE)
+_WEAK_MARKERS = ("i might", "i may", "i'm thinking", "i could")
+
+# Invisible characters are dropped, fullwidth punctuation mapped to ASCII, all in one pass
+_NORMALIZE_TABLE = str.maketrans({
+    "\ufeff": "", "\u200b": "", "\u200c": "", "\u200d": "",
+    "\uff0e": ".", "\uff0c": ",",
+})
+
+
+def _looks_sensitive_regex(summary: str) -> bool:
+    """Block saving anything that looks like passwords, keys, or other secrets."""
+    if _SENSITIVE_LEAD.isdisjoint(summary):
+        return False
+    return _SENSITIVE_RE.search(summary) is not None
 
 
-def _looks_sensitive(summary: str) -> bool:
-    """Block saving anything that looks like passwords, keys, or other secrets."""
-    lower = summary.lower()
-    return any(p in lower for p in SENSITIVE_PATTERNS)
+def _looks_sensitive_ac(summary: str) -> bool:
+    """Same check as _looks_sensitive_regex, run through the Aho-Corasick automaton in C."""
+    if _SENSITIVE_LEAD.isdisjoint(summary):
+        return False
+    return next(_SENSITIVE_AC.iter(summary.lower()), None) is not None
+
+
+# pyahocorasick is optional; without it we fall back to the compiled regex
+try:
+    import ahocorasick
+except ImportError:
+    _SENSITIVE_AC = None
+    _looks_sensitive = _looks_sensitive_regex
+else:
+    _SENSITIVE_AC = ahocorasick.Automaton()
+    for _pattern in SENSITIVE_PATTERNS:
+        _SENSITIVE_AC.add_word(_pattern, _pattern)
+    _SENSITIVE_AC.make_automaton()
+    _looks_sensitive = _looks_sensitive_ac
 
 
 def _normalize_input(s: str) -> str:
     """Strip BOM/invisible chars, normalize punctuation and whitespace so regex matches reliably."""
-    if not s:
-        return ""
-    s = s.replace("\ufeff", "").replace("\u200b", "").replace("\u200c", "").replace("\u200d", "")
-    s = s.replace("\uff0e", ".").replace("\uff0c", ",")
-    return " ".join(s.split())
+    return " ".join(s.translate(_NORMALIZE_TABLE).split())
 
 
 def analyze_memory_signal(user_input: str):
@@ -35,7 +71,10 @@ def analyze_memory_signal(user_input: str):
 
     decisions = []
 
-    role_match = re.search(r"\b(?:i\s+am|i'm)\s+a[n]?\s+(.+?)\s*(?:\.|,|\s+and\s+|$)", lower, re.IGNORECASE)
+    # Input is whitespace-normalized, so a plain substring check tells us whether a regex can match at all
+    has_i_am = "i am" in lower or "i'm" in lower
+
+    role_match = _ROLE_RE.search(lower) if has_i_am else None
     if role_match:
         role = role_match.group(1).strip().rstrip(".,")
         if role:
@@ -46,8 +85,8 @@ def analyze_memory_signal(user_input: str):
                 "summary": f"User is {article} {role}",
                 "confidence": 0.9
             })
-    else:
-        role_short = re.search(r"\b(?:i\s+am|i'm)\s+(?!a[n]?\s)(.+?)\s*(?:\.|,|\s+and\s+|$)", lower, re.IGNORECASE)
+    elif has_i_am:
+        role_short = _ROLE_SHORT_RE.search(lower)
         if role_short:
             role = text[role_short.start(1):role_short.end(1)].strip().rstrip(".,")
             if role and len(role) >= 2:
@@ -59,7 +98,7 @@ def analyze_memory_signal(user_input: str):
                     "confidence": 0.9
                 })
 
-    preference_match = re.search(r"\b(?:i\s+prefer|i'd\s+prefer)\s+(.+?)\s*(?:\.|,|\s+and\s+|$)", lower, re.IGNORECASE)
+    preference_match = _PREF_RE.search(lower) if ("i prefer" in lower or "i'd prefer" in lower) else None
     if preference_match:
         preference = preference_match.group(1).strip().rstrip(".,")
         if preference:
@@ -71,7 +110,7 @@ def analyze_memory_signal(user_input: str):
                 "confidence": 0.85
             })
 
-    org_match = re.search(r"\bour\s+team\s+(.+?)\s*(?:\.|,|$)", lower, re.IGNORECASE)
+    org_match = _ORG_RE.search(lower) if "our team" in lower else None
     if org_match:
         insight = text[org_match.start(1):org_match.end(1)].strip().rstrip(".,")
         if insight:
@@ -82,7 +121,7 @@ def analyze_memory_signal(user_input: str):
                 "confidence": 0.8
             })
 
-    weak_match = re.search(r"\b(?:i\s+might|i\s+may|i'm\s+thinking|i\s+could)\s+.+", lower)
+    weak_match = _WEAK_RE.search(lower) if any(m in lower for m in _WEAK_MARKERS) else None
     if weak_match and not decisions:
         decisions.append({
             "should_write": False,
@@ -102,9 +141,60 @@ def analyze_memory_signal(user_input: str):
     return decisions
 
 
+# Entry lines already in each memory file, keyed by the (mtime_ns, size) they were read at
+_seen_cache: dict[Path, tuple[tuple[int, int], set[str]]] = {}
+
+
+def _file_stamp(path: Path) -> tuple[int, int]:
+    """Cheap change marker for a memory file: modification time and size."""
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load_seen(path: Path) -> set[str]:
+    """Return the "- ..." entries in a memory file, re-reading it only if it changed on disk."""
+    if not path.exists():
+        path.write_text("# Memory Log\n\n", encoding="utf-8")
+    stamp = _file_stamp(path)
+    cached = _seen_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    existing = path.read_text(encoding="utf-8")
+    seen = {line.rstrip() for line in existing.splitlines() if line.startswith("- ")}
+    _seen_cache[path] = (stamp, seen)
+    return seen
+
+
+# Full text of each memory file for the viewer, keyed the same way as _seen_cache
+_text_cache: dict[Path, tuple[tuple[int, int], str]] = {}
+
+
+def read_memory_text(path: Path) -> str:
+    """Return a memory file's contents, re-reading it only if it changed on disk."""
+    try:
+        stamp = _file_stamp(path)
+    except FileNotFoundError:
+        return "# Memory Log\n\n"
+    cached = _text_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    content = path.read_text(encoding="utf-8")
+    _text_cache[path] = (stamp, content)
+    return content
+
+
+def _entry_line(summary: str) -> Optional[str]:
+    """Format a summary as the single "- ..." line it is stored and deduped as (None if it's blank)."""
+    text = " ".join(line.strip() for line in summary.splitlines() if line.strip())
+    return f"- {text}" if text else None
+
+
 def persist_memory(decisions):
     """Write approved decisions to USER_MEMORY.md or COMPANY_MEMORY.md, skip dupes and low confidence."""
     written = []
+    # Each file is appended to once, however many decisions target it
+    seen_by_path = {}
+    pending_by_path = {}
 
     for decision in decisions:
         if not decision.get("should_write"):
@@ -126,21 +216,31 @@ def persist_memory(decisions):
         else:
             continue
 
-        entry = f"- {summary}\n"
+        entry = _entry_line(summary)
+        if entry is None:
+            continue
 
-        if not file_path.exists():
-            file_path.write_text("# Memory Log\n\n", encoding="utf-8")
+        if file_path not in seen_by_path:
+            seen_by_path[file_path] = _load_seen(file_path)
+            pending_by_path[file_path] = {}
 
-        existing = file_path.read_text(encoding="utf-8")
+        pending = pending_by_path[file_path]
+        if entry in seen_by_path[file_path] or entry in pending:
+            continue
+        pending[entry] = None
 
-        if summary not in existing:
-            with file_path.open("a", encoding="utf-8") as f:
-                f.write(entry)
+        written.append({
+            "target": target,
+            "summary": summary,
+            "confidence": decision.get("confidence", 0.0)
+        })
 
-            written.append({
-                "target": target,
-                "summary": summary,
-                "confidence": decision.get("confidence", 0.0)
-            })
+    for file_path, entries in pending_by_path.items():
+        if entries:
+            with file_path.open("a", encoding="utf-8") as f:
+                f.write("".join(f"{entry}\n" for entry in entries))
+            seen = seen_by_path[file_path]
+            seen.update(entries)
+            _seen_cache[file_path] = (_file_stamp(file_path), seen)
 
     return written
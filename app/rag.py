@@ -1,9 +1,15 @@
+import hashlib
 import os
 import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 from dotenv import load_dotenv
+import numpy as np
 import chromadb
 from chromadb.utils import embedding_functions
 from openai import OpenAI
@@ -19,15 +25,114 @@ client = OpenAI(api_key=OPENAI_API_KEY)
 # Web app uses "web_documents", CLI/sanity uses "documents" so they don't share index
 _collection_name = os.environ.get("CHROMA_COLLECTION_NAME", "documents")
 chroma_client = chromadb.Client()
+_embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
+    api_key=OPENAI_API_KEY,
+    model_name="text-embedding-3-small",
+)
 collection = chroma_client.get_or_create_collection(
     name=_collection_name,
-    embedding_function=embedding_functions.OpenAIEmbeddingFunction(
-        api_key=OPENAI_API_KEY,
-        model_name="text-embedding-3-small",
-    ),
+    embedding_function=_embedding_fn,
 )
 
-_indexed_docs: list[dict] = []
+_WORD_RE = re.compile(r"\w+")
+
+# BeautifulSoup backend for HTML uploads: lxml when installed, else the stdlib parser
+try:
+    import lxml  # noqa: F401
+    _HTML_PARSER = "lxml"
+except ImportError:
+    _HTML_PARSER = "html.parser"
+
+# In-memory keyword index kept as parallel lists (position i is the same chunk in each)
+_ids: list[str] = []
+_metas: list[dict] = []
+_tok_texts: list[list[str]] = []
+_tok_sets: list[frozenset[str]] = []
+_id_to_index: dict[str, int] = {}
+# Bumped whenever the lists above change so the cached BM25 index knows to rebuild
+_indexed_version = 0
+# Guards the lists above (and the cached BM25 built from them) when several files index at once
+_index_lock = threading.Lock()
+_bm25_obj = None
+_bm25_version = -1
+
+# 1 / (k + rank) for the default RRF k, indexed by 0-based rank
+_RRF_K = 60
+_RRF_WEIGHTS = [1.0 / (_RRF_K + rank) for rank in range(1, 501)]
+
+# Chunks are sent to the vector store in batches of this size while a document streams in
+_INDEX_BATCH_SIZE = 256
+# New chunk texts are embedded in sub-batches of this size. Every indexing call shares one pool, so at most
+# EMBED_WORKERS embedding requests are in flight in the process however many files index at once.
+# Set EMBED_WORKERS=1 to embed sequentially.
+_EMBED_BATCH_SIZE = 64
+_EMBED_WORKERS = max(1, int(os.environ.get("EMBED_WORKERS", "4")))
+_embed_executor = ThreadPoolExecutor(max_workers=_EMBED_WORKERS, thread_name_prefix="embed")
+
+
+def _add_indexed_chunk(doc_id: str, text: str, metadata: dict) -> None:
+    """Append one chunk to the in-memory keyword index, tokenizing it once up front."""
+    _id_to_index[doc_id] = len(_ids)
+    _ids.append(doc_id)
+    _metas.append(metadata)
+    tokens = _WORD_RE.findall(text.lower())
+    _tok_texts.append(tokens)
+    _tok_sets.append(frozenset(tokens))
+
+
+def _drop_indexed_source(source_name: str) -> bool:
+    """Remove every in-memory chunk from source_name; returns True if anything was removed."""
+    keep = [i for i, meta in enumerate(_metas) if meta.get("source") != source_name]
+    if len(keep) == len(_ids):
+        return False
+    for column in (_ids, _metas, _tok_texts, _tok_sets):
+        column[:] = [column[i] for i in keep]
+    _id_to_index.clear()
+    _id_to_index.update((doc_id, i) for i, doc_id in enumerate(_ids))
+    return True
+
+
+def _content_hash(text: str) -> str:
+    """Stable fingerprint of a chunk's text, stored in metadata so identical chunks can share embeddings."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _embeddings_by_hash(result: dict) -> dict[str, list[float]]:
+    """Map content_hash -> embedding from a collection.get(include=["embeddings", "metadatas"]) result."""
+    embeddings = result.get("embeddings")
+    if embeddings is None:
+        return {}
+    found = {}
+    for meta, emb in zip(result.get("metadatas") or [], embeddings):
+        content_hash = (meta or {}).get("content_hash")
+        if content_hash and content_hash not in found:
+            found[content_hash] = [float(x) for x in emb]
+    return found
+
+
+@lru_cache(maxsize=2048)
+def _embed(query: str) -> tuple[float, ...]:
+    """Embed a query once and remember it, so repeat questions skip the OpenAI round trip."""
+    return tuple(float(x) for x in _embedding_fn([query])[0])
+
+
+@lru_cache(maxsize=256)
+def _tokenize_query(query: str) -> tuple[str, ...]:
+    """Lowercased word tokens of a query, shared by BM25 and the keyword reranker."""
+    return tuple(_WORD_RE.findall(query.lower()))
+
+
+def _embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed chunk texts, overlapping the OpenAI requests for each sub-batch on the shared embedding pool."""
+    batches = [texts[i:i + _EMBED_BATCH_SIZE] for i in range(0, len(texts), _EMBED_BATCH_SIZE)]
+    results = list(_embed_executor.map(_embedding_fn, batches))
+    return [[float(x) for x in emb] for batch in results for emb in batch]
+
+
+def clear_query_caches() -> None:
+    """Forget cached query embeddings and tokens (e.g. from an admin cache reset)."""
+    _embed.cache_clear()
+    _tokenize_query.cache_clear()
 
 
 def _read_text(file_path: str) -> str:
@@ -38,8 +143,8 @@ def _read_text(file_path: str) -> str:
     return path.read_text(encoding="utf-8", errors="replace")
 
 
-def _parse_pdf(file_path: str) -> list[tuple[str, str]]:
-    """Turn each PDF page into a (page_label, text) pair for chunking."""
+def _parse_pdf(file_path: str) -> Iterator[tuple[str, str]]:
+    """Open the PDF and return an iterator of (page_label, text) pairs for chunking."""
     try:
         from pypdf import PdfReader
     except ImportError:
@@ -49,21 +154,27 @@ def _parse_pdf(file_path: str) -> list[tuple[str, str]]:
         raise FileNotFoundError(f"File not found: {file_path}")
     try:
         reader = PdfReader(str(path))
-        blocks = []
+    except Exception as e:
+        raise ValueError(f"Error parsing PDF {file_path}: {str(e)}")
+    return _iter_pdf_pages(reader, file_path)
+
+
+def _iter_pdf_pages(reader, file_path: str) -> Iterator[tuple[str, str]]:
+    """Yield one page at a time so a large PDF's text is never held in memory all at once."""
+    found_text = False
+    try:
         for i, page in enumerate(reader.pages, start=1):
             try:
-                text = page.extract_text() or ""
-                if text.strip():
-                    blocks.append((f"page_{i}", text.strip()))
-            except Exception as e:
+                text = (page.extract_text() or "").strip()
+            except Exception:
                 continue
-        if not blocks:
-            raise ValueError(f"Could not extract any text from PDF: {file_path}")
-        return blocks
+            if text:
+                found_text = True
+                yield (f"page_{i}", text)
     except Exception as e:
-        if isinstance(e, (ImportError, FileNotFoundError, ValueError)):
-            raise
         raise ValueError(f"Error parsing PDF {file_path}: {str(e)}")
+    if not found_text:
+        raise ValueError(f"Could not extract any text from PDF: {file_path}")
 
 
 def _parse_html(file_path: str) -> list[tuple[str, str]]:
@@ -76,7 +187,7 @@ def _parse_html(file_path: str) -> list[tuple[str, str]]:
     if not path.exists():
         raise FileNotFoundError(f"File not found: {file_path}")
     raw = path.read_text(encoding="utf-8", errors="replace")
-    soup = BeautifulSoup(raw, "html.parser")
+    soup = BeautifulSoup(raw, _HTML_PARSER)
     for tag in soup(["script", "style"]):
         tag.decompose()
     blocks = []
@@ -106,8 +217,11 @@ def _parse_html(file_path: str) -> list[tuple[str, str]]:
     return blocks
 
 
-def load_document(file_path: str) -> list[tuple[str, str]]:
-    """Pick the right parser (PDF, HTML, or plain text) and return (locator, text) blocks."""
+def load_document(file_path: str) -> Iterable[tuple[str, str]]:
+    """Pick the right parser (PDF, HTML, or plain text) and return (locator, text) blocks.
+
+    PDFs come back as a lazy iterator over pages; other formats as a list.
+    """
     path = Path(file_path)
     if not path.exists():
         raise FileNotFoundError(f"File not found: {file_path}")
@@ -132,69 +246,75 @@ def load_document(file_path: str) -> list[tuple[str, str]]:
 def _chunk_by_paragraphs(text: str, max_chars: int = 800) -> list[tuple[str, str]]:
     """Split text into chunks on newlines, keeping each chunk under max_chars."""
     paragraphs = text.split("\n")
+    n = len(paragraphs)
+    lens = [len(para) + 1 for para in paragraphs]
     chunks = []
-    current = []
-    current_len = 0
     chunk_id = 0
-    for para in paragraphs:
-        plen = len(para) + 1
-        if current_len + plen > max_chars and current:
-            chunk_text = "\n".join(current).strip()
-            if chunk_text:
-                chunks.append((f"chunk_{chunk_id}", chunk_text))
-                chunk_id += 1
-            current = []
-            current_len = 0
-        current.append(para)
-        current_len += plen
-    if current:
-        chunk_text = "\n".join(current).strip()
+    i = 0
+    while i < n:
+        # Widen the window [i, j) while it fits; a single oversize paragraph still gets its own chunk
+        j = i
+        total = 0
+        while j < n and total + lens[j] <= max_chars:
+            total += lens[j]
+            j += 1
+        j = max(j, i + 1)
+        chunk_text = "\n".join(paragraphs[i:j]).strip()
         if chunk_text:
             chunks.append((f"chunk_{chunk_id}", chunk_text))
+            chunk_id += 1
+        i = j
     return chunks
 
 
-def _split_markdown_headers(text: str) -> list[tuple[str, str]]:
-    """Split on ## style headers so we don't break sections in the middle."""
-    parts = re.split(r"^(#{1,6}\s+.+)$", text, flags=re.MULTILINE)
+def _split_markdown_headers(text: str) -> Optional[list[tuple[str, str]]]:
+    """Split on ## style headers so we don't break sections in the middle.
+
+    Returns None when the text has no header lines, so callers can chunk it as-is.
+    """
     blocks = []
+    saw_header = False
     current_header = "document"
     current_body = []
-    for i, part in enumerate(parts):
-        part = part.strip()
-        if not part:
-            continue
-        if part.startswith("#") and i % 2 == 1:
-            if current_body:
-                blocks.append((current_header, "\n".join(current_body).strip()))
-                current_body = []
-            current_header = part.replace("#", "").strip()[:80]
-        else:
-            current_body.append(part)
-    if current_body:
-        blocks.append((current_header, "\n".join(current_body).strip()))
+
+    def flush():
+        body = "\n".join(current_body).strip()
+        if body:
+            blocks.append((current_header, body))
+        current_body.clear()
+
+    for line in text.split("\n"):
+        if line.startswith("#"):
+            level = len(line) - len(line.lstrip("#"))
+            rest = line[level:]
+            if level <= 6 and rest[:1].isspace() and rest.strip():
+                flush()
+                saw_header = True
+                current_header = rest.replace("#", "").strip()[:80]
+                continue
+        current_body.append(line)
+    if not saw_header:
+        return None
+    flush()
     return blocks if blocks else [("document", text)]
 
 
-def chunk_document(blocks: list[tuple[str, str]], max_chars: int = 800) -> list[tuple[str, str, str]]:
-    """Turn document blocks into (chunk_id, text, locator) triples for indexing."""
-    result = []
+def _iter_chunks(blocks: Iterable[tuple[str, str]], max_chars: int = 800) -> Iterator[tuple[str, str, str]]:
+    """Yield (chunk_id, text, locator) triples as blocks are consumed."""
     chunk_id = 0
     for locator, text in blocks:
-        if "##" in text or "\n# " in text:
-            sub_blocks = _split_markdown_headers(text)
-            for sub_loc, sub_text in sub_blocks:
-                sub_chunks = _chunk_by_paragraphs(sub_text, max_chars)
-                for _, ctext in sub_chunks:
-                    combined_locator = f"{locator} | {sub_loc}" if sub_loc != "document" else locator
-                    result.append((f"chunk_{chunk_id}", ctext, combined_locator))
-                    chunk_id += 1
-        else:
-            sub_chunks = _chunk_by_paragraphs(text, max_chars)
+        sub_blocks = _split_markdown_headers(text) or [("document", text)]
+        for sub_loc, sub_text in sub_blocks:
+            sub_chunks = _chunk_by_paragraphs(sub_text, max_chars)
             for _, ctext in sub_chunks:
-                result.append((f"chunk_{chunk_id}", ctext, locator))
+                combined_locator = f"{locator} | {sub_loc}" if sub_loc != "document" else locator
+                yield (f"chunk_{chunk_id}", ctext, combined_locator)
                 chunk_id += 1
-    return result
+
+
+def chunk_document(blocks: Iterable[tuple[str, str]], max_chars: int = 800) -> list[tuple[str, str, str]]:
+    """Turn document blocks into (chunk_id, text, locator) triples for indexing."""
+    return list(_iter_chunks(blocks, max_chars))
 
 
 def chunk_text(text: str, max_chars: int = 800) -> list[tuple[str, str]]:
@@ -206,6 +326,7 @@ def chunk_text(text: str, max_chars: int = 800) -> list[tuple[str, str]]:
 
 def index_document(file_path: str, use_hybrid: bool = True, source_tag: Optional[str] = None) -> dict:
     """Parse file, chunk it, and add to the vector store (and BM25 if use_hybrid). Returns stats."""
+    global _indexed_version
     path = Path(file_path)
     if not path.exists():
         raise FileNotFoundError(f"File not found: {file_path}")
@@ -213,8 +334,11 @@ def index_document(file_path: str, use_hybrid: bool = True, source_tag: Optional
     source_name = source_tag if source_tag else path.name
 
     deleted_count = 0
+    # Embeddings of the chunks being replaced, so unchanged chunks aren't sent to OpenAI again
+    known_embeddings: dict[str, list[float]] = {}
     try:
-        existing = collection.get(where={"source": source_name})
+        existing = collection.get(where={"source": source_name}, include=["embeddings", "metadatas"])
+        known_embeddings = _embeddings_by_hash(existing)
         existing_ids = existing.get("ids") or []
         flat_ids: list[str] = []
         for item in existing_ids:
@@ -228,45 +352,86 @@ def index_document(file_path: str, use_hybrid: bool = True, source_tag: Optional
     except Exception:
         pass
 
-    if _indexed_docs:
-        _indexed_docs[:] = [
-            d for d in _indexed_docs
-            if d.get("metadata", {}).get("source") != source_name
-        ]
+    with _index_lock:
+        if _ids and _drop_indexed_source(source_name):
+            _indexed_version += 1
 
     blocks = load_document(file_path)
-    if not blocks:
-        raise ValueError(f"No content extracted from file: {file_path}")
 
-    triples = chunk_document(blocks, max_chars=800)
-    if not triples:
-        raise ValueError(f"No chunks created from file: {file_path}")
-
-    chunks_created = len(triples)
+    chunks_created = 0
     ids = []
     documents = []
     metadatas = []
-    for i, (chunk_id, chunk_text_content, locator) in enumerate(triples):
-        doc_id = f"{source_name}::{chunk_id}"
-        ids.append(doc_id)
-        documents.append(chunk_text_content)
-        metadatas.append({
-            "source": source_name,
-            "locator": locator,
-            "chunk_id": chunk_id
-        })
+    # Every id sent to the vector store so far, so a failure part-way can take them back out
+    added_ids: list[str] = []
+
+    def flush():
+        global _indexed_version
+        if not ids:
+            return
+        hashes = [meta["content_hash"] for meta in metadatas]
+        missing = [h for h in set(hashes) if h not in known_embeddings]
+        if missing:
+            try:
+                known_embeddings.update(_embeddings_by_hash(collection.get(
+                    where={"content_hash": {"$in": missing}},
+                    include=["embeddings", "metadatas"],
+                )))
+            except Exception:
+                pass
+        # Embed each distinct new text once; everything else reuses a stored vector
+        new_texts = {}
+        for h, text in zip(hashes, documents):
+            if h not in known_embeddings and h not in new_texts:
+                new_texts[h] = text
+        if new_texts:
+            fresh = _embed_texts(list(new_texts.values()))
+            known_embeddings.update(zip(new_texts, fresh))
+        added_ids.extend(ids)
+        collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=[known_embeddings[h] for h in hashes],
+        )
         if use_hybrid:
-            _indexed_docs.append({
-                "id": doc_id,
-                "text": chunk_text_content,
-                "metadata": {"source": source_name, "locator": locator, "chunk_id": chunk_id},
+            with _index_lock:
+                for doc_id, text, meta in zip(ids, documents, metadatas):
+                    _add_indexed_chunk(doc_id, text, meta)
+                _indexed_version += 1
+        ids.clear()
+        documents.clear()
+        metadatas.clear()
+
+    try:
+        for chunk_id, chunk_text_content, locator in _iter_chunks(blocks, max_chars=800):
+            ids.append(f"{source_name}::{chunk_id}")
+            documents.append(chunk_text_content)
+            metadatas.append({
+                "source": source_name,
+                "locator": locator,
+                "chunk_id": chunk_id,
+                "content_hash": _content_hash(chunk_text_content),
             })
+            chunks_created += 1
+            if len(ids) >= _INDEX_BATCH_SIZE:
+                flush()
+        flush()
+    except Exception:
+        # A page or embedding error after earlier batches landed: don't leave the source half-indexed
+        if added_ids:
+            try:
+                collection.delete(ids=added_ids)
+            except Exception:
+                pass
+        with _index_lock:
+            if _ids and _drop_indexed_source(source_name):
+                _indexed_version += 1
+        raise
+
+    if not chunks_created:
+        raise ValueError(f"No chunks created from file: {file_path}")
 
-    if not ids:
-        raise ValueError(f"No valid chunks to index from file: {file_path}")
-    
-    collection.add(ids=ids, documents=documents, metadatas=metadatas)
-    
     return {
         "files_parsed": 1,
         "chunks_created": chunks_created,
@@ -278,43 +443,52 @@ def index_document(file_path: str, use_hybrid: bool = True, source_tag: Optional
 
 def _bm25_retrieve(query: str, top_k: int = 10):
     """Keyword-style search over the in-memory docs; used together with vector search."""
-    if not _indexed_docs:
+    global _bm25_obj, _bm25_version
+    if not _ids:
         return []
     try:
         from rank_bm25 import BM25Okapi
     except ImportError:
         return []
-    corpus = [d["text"] for d in _indexed_docs]
-    tokenize = lambda s: re.findall(r"\w+", s.lower())
-    tokenized = [tokenize(t) for t in corpus]
-    bm25 = BM25Okapi(tokenized)
-    scores = bm25.get_scores(tokenize(query))
-    top_indices = sorted(range(len(scores)), key=lambda i: -scores[i])[: top_k * 2]
-    return [(_indexed_docs[i]["id"], float(scores[i])) for i in top_indices if scores[i] > 0]
+    with _index_lock:
+        if not _ids:
+            return []
+        if _bm25_version != _indexed_version:
+            _bm25_obj = BM25Okapi(_tok_texts)
+            _bm25_version = _indexed_version
+        scores = _bm25_obj.get_scores(_tokenize_query(query))
+        k = min(top_k * 2, len(scores))
+        if k <= 0:
+            return []
+        # Partial selection of the top k, then sort only that slice
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-scores[top_indices], kind="stable")]
+        return [(_ids[i], float(scores[i])) for i in top_indices if scores[i] > 0]
 
 
 def _reciprocal_rank_fusion(ranking_lists: list[list[str]], k: int = 60) -> list[str]:
     """Merge several ranked lists (e.g. vector + BM25) into one order."""
-    scores = {}
+    weights = _RRF_WEIGHTS if k == _RRF_K else []
+    n_weights = len(weights)
+    scores = defaultdict(float)
     for rlist in ranking_lists:
-        for rank, doc_id in enumerate(rlist, start=1):
-            scores[doc_id] = scores.get(doc_id, 0) + 1 / (k + rank)
+        for rank, doc_id in enumerate(rlist):
+            scores[doc_id] += weights[rank] if rank < n_weights else 1.0 / (k + rank + 1)
     return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda x: -x[1])]
 
 
 def _rerank_by_keyword_overlap(query: str, doc_ids: list[str], top_k: int) -> list[str]:
     """Reorder docs by how many query words appear in them (simple relevance boost)."""
-    q_words = set(re.findall(r"\w+", query.lower()))
-    id_to_doc = {d["id"]: d for d in _indexed_docs}
+    q_words = frozenset(_tokenize_query(query))
     scored = []
-    for doc_id in doc_ids:
-        doc = id_to_doc.get(doc_id)
-        if not doc:
-            scored.append((doc_id, 0))
-            continue
-        d_words = set(re.findall(r"\w+", doc["text"].lower()))
-        overlap = len(q_words & d_words)
-        scored.append((doc_id, overlap))
+    with _index_lock:
+        for doc_id in doc_ids:
+            idx = _id_to_index.get(doc_id)
+            if idx is None:
+                scored.append((doc_id, 0))
+                continue
+            overlap = len(q_words & _tok_sets[idx])
+            scored.append((doc_id, overlap))
     scored.sort(key=lambda x: -x[1])
     return [doc_id for doc_id, _ in scored[:top_k]]
 
@@ -328,17 +502,16 @@ def retrieve_chunks(
 ):
     """Fetch top_k chunks: vector search, optionally fused with BM25 and reranked."""
     n_results = top_k * 3 if (use_hybrid or rerank) else top_k
-    query_kw = {"query_texts": [query], "n_results": min(n_results, 100)}
+    query_kw = {"query_embeddings": [list(_embed(query))], "n_results": min(n_results, 100)}
     if source_filter:
         query_kw["where"] = {"source": source_filter}
     results = collection.query(**query_kw)
     vec_ids = results.get("ids", [[]])[0]
     vec_docs = results.get("documents", [[]])[0]
     vec_metas = results.get("metadatas", [[]])[0]
-    id_to_doc = dict(zip(vec_ids, vec_docs))
-    id_to_meta = dict(zip(vec_ids, vec_metas))
+    vec_pos = {doc_id: i for i, doc_id in enumerate(vec_ids)}
 
-    if use_hybrid and _indexed_docs:
+    if use_hybrid and _ids:
         bm25_pairs = _bm25_retrieve(query, top_k=top_k * 2)
         bm25_ids = [x[0] for x in bm25_pairs if x[1] > 0]
         if bm25_ids:
@@ -348,22 +521,23 @@ def retrieve_chunks(
     else:
         fused_ids = vec_ids[: top_k * 2]
 
-    if rerank and fused_ids and _indexed_docs:
+    if rerank and fused_ids and _ids:
         fused_ids = _rerank_by_keyword_overlap(query, fused_ids, top_k * 2)
 
     seen = set()
-    out_ids = []
+    documents = []
+    metadatas = []
     for doc_id in fused_ids:
         if doc_id in seen:
             continue
         seen.add(doc_id)
-        if doc_id in id_to_doc:
-            out_ids.append(doc_id)
-        if len(out_ids) >= top_k:
+        pos = vec_pos.get(doc_id)
+        if pos is not None:
+            documents.append(vec_docs[pos])
+            metadatas.append(vec_metas[pos])
+        if len(documents) >= top_k:
             break
 
-    documents = [id_to_doc[i] for i in out_ids]
-    metadatas = [id_to_meta[i] for i in out_ids]
     return documents, metadatas
 
 
@@ -408,7 +582,10 @@ def answer_with_citations(
     rerank: bool = True,
     source_filter: Optional[str] = None,
 ) -> dict:
-    """Full RAG: retrieve, answer, and attach source/locator/snippet for each chunk used."""
+    """Full RAG: retrieve, answer, and attach source/locator/snippet for each chunk used.
+
+    The retrieved documents and metadatas are returned too, so callers can show them without searching again.
+    """
     documents, metadatas = retrieve_chunks(
         query, top_k=top_k, use_hybrid=use_hybrid, rerank=rerank, source_filter=source_filter
     )
@@ -416,6 +593,8 @@ def answer_with_citations(
         return {
             "answer": "I couldn't find anything relevant in the documents you've uploaded. Could you try rephrasing your question or upload different documents?",
             "citations": [],
+            "documents": documents,
+            "metadatas": metadatas,
         }
     answer = generate_answer(query, documents)
     citations = [
@@ -427,4 +606,4 @@ def answer_with_citations(
         }
         for doc, meta in zip(documents, metadatas)
     ]
-    return {"answer": answer, "citations": citations}
+    return {"answer": answer, "citations": citations, "documents": documents, "metadatas": metadatas}
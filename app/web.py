@@ -2,37 +2,109 @@ import os
 # Use a separate Chroma collection for the web app so "make sanity" doesn't preload our index
 os.environ["CHROMA_COLLECTION_NAME"] = "web_documents"
 
-import json
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from cachetools import TTLCache
 from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
+from flask_cors import CORS
+import orjson
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import BaseTarget, ValueTarget
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
 
-from app.rag import index_document, answer_with_citations
-from app.memory import analyze_memory_signal, persist_memory
+from app.rag import index_document, answer_with_citations, clear_query_caches
+from app.memory import (
+    analyze_memory_signal, persist_memory, read_memory_text, _looks_sensitive, USER_MEMORY_FILE, COMPANY_MEMORY_FILE
+)
+
+
+class ORJSONProvider(JSONProvider):
+    """Serialize jsonify() responses with orjson, writing the UTF-8 bytes straight into the response."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Same argument rules as jsonify(): one value, several as a list, or keyword arguments as a dict
+        if args and kwargs:
+            raise TypeError('jsonify() takes either args or kwargs, not both')
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs or None
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 
 project_root = Path(__file__).parent.parent
 app = Flask(__name__, 
             template_folder=str(project_root / 'templates'),
             static_folder=str(project_root / 'static'))
+# CORS for the API; max_age lets browsers cache the preflight for a day
+CORS(app, resources={r'/api/*': {
+    'origins': '*',
+    'methods': ['GET', 'POST', 'OPTIONS'],
+    'allow_headers': ['Content-Type', 'Authorization'],
+    'max_age': 86400
+}})
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = 'uploads'
-
-@app.after_request
-def after_request(response):
-    """Add CORS headers so the front end can call the API from the same host."""
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
+app.json = ORJSONProvider(app)
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 60})
 
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'html', 'htm', 'md'}
+# Dotted suffixes for a single str.endswith check per filename
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+UPLOAD_READ_SIZE = 64 * 1024
+# Files of one upload parsed/chunked side by side; their OpenAI embedding calls are capped separately by EMBED_WORKERS
+MAX_INDEX_WORKERS = 8
+
+# Uploads are indexed in the background: one job at a time (so two uploads never race on the same
+# source), each job indexing its own files in parallel. Finished jobs are kept for status polling.
+MAX_TRACKED_JOBS = 200
+_index_executor = ThreadPoolExecutor(max_workers=1)
+_index_jobs = {}
+_index_jobs_lock = threading.Lock()
+
+# Finished /api/ask responses keyed by (question, top_k, use_hybrid); emptied whenever the index changes
+_ask_cache = TTLCache(maxsize=512, ttl=600)
+_ask_cache_lock = threading.Lock()
+
+
+def _cache_ok(rv):
+    """Only cache plain successful responses; error paths return (response, status) tuples."""
+    return not isinstance(rv, tuple)
+
+
+def clear_ask_cache():
+    """Drop cached answers so the next question sees newly indexed documents."""
+    with _ask_cache_lock:
+        _ask_cache.clear()
+
+
+def _json_body():
+    """Parse the request body with orjson; anything that isn't a JSON object becomes {}."""
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
 
 def allowed_file(filename):
     """Only allow extensions we know how to parse (txt, pdf, html, md)."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
 
 @app.route('/')
@@ -45,6 +117,7 @@ def index():
 
 
 @app.route('/health')
+@cache.cached(timeout=300, key_prefix='health', response_filter=_cache_ok)
 def health():
     """Simple health check so we know the server and template are OK."""
     return jsonify({
@@ -77,98 +150,273 @@ Template exists: {template_exists}
     )
 
 
+class _UploadTarget(BaseTarget):
+    """Streams each uploaded 'file' part to the upload folder as the request body arrives.
+
+    Parts are written to a temp file and only moved over uploads/<name> once complete,
+    so a truncated upload never replaces an existing file.
+    """
+
+    def __init__(self, upload_folder):
+        super().__init__()
+        self.upload_folder = upload_folder
+        self.files = []
+        self._fd = None
+        self._entry = None
+        self._tmp_paths = set()
+
+    def on_start(self):
+        original = self.multipart_filename or ''
+        entry = {'original': original, 'filename': None, 'filepath': None}
+        self._entry = None
+        if original and allowed_file(original):
+            filename = secure_filename(original)
+            if filename:
+                try:
+                    fd, tmp_path = tempfile.mkstemp(dir=self.upload_folder, prefix='.', suffix='.part')
+                    self._fd = os.fdopen(fd, 'wb')
+                    self._tmp_paths.add(tmp_path)
+                    entry.update(_tmp=tmp_path, _filename=filename, error='The upload was interrupted')
+                    self._entry = entry
+                except OSError as e:
+                    entry['error'] = str(e)
+        self.files.append(entry)
+
+    def on_data_received(self, chunk):
+        if self._fd:
+            self._fd.write(chunk)
+
+    def on_finish(self):
+        self.close()
+        entry = self._entry
+        self._entry = None
+        if entry is None:
+            return
+        tmp_path = entry.pop('_tmp')
+        filename = entry.pop('_filename')
+        filepath = os.path.join(self.upload_folder, filename)
+        try:
+            os.replace(tmp_path, filepath)
+        except OSError as e:
+            entry['error'] = str(e)
+            return
+        self._tmp_paths.discard(tmp_path)
+        entry.pop('error')
+        entry.update(filename=filename, filepath=filepath)
+
+    def close(self):
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+
+    def discard_partial(self):
+        """Close the open part and delete any temp file that never finished arriving."""
+        self.close()
+        for tmp_path in self._tmp_paths:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        self._tmp_paths.clear()
+
+
+def _indexing_result(future, filename):
+    """Turn a finished index_document future into the per-file entry the upload response lists."""
+    try:
+        stats = future.result()
+    except ImportError as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': str(e),
+            'hint': 'Install missing dependency: pip install pypdf (for PDF) or beautifulsoup4 (for HTML)'
+        }
+    except ValueError as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': str(e)
+        }
+    except FileNotFoundError as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': f'I had trouble processing this file: {str(e)}'
+        }
+    return {
+        'filename': filename,
+        'success': True,
+        'stats': stats
+    }
+
+
+def _index_uploads(results, to_index, tag, total_files):
+    """Index saved files into their result slots and build the upload summary the UI shows."""
+    if to_index:
+        # Re-indexing a source replaces its chunks, so files sharing a source (one source_tag, or a repeated
+        # filename) must run in upload order; otherwise index them side by side
+        sources = [tag or filename for _, filename, _ in to_index]
+        workers = min(MAX_INDEX_WORKERS, len(to_index)) if len(set(sources)) == len(sources) else 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(index_document, filepath, source_tag=tag): (slot, filename)
+                for slot, filename, filepath in to_index
+            }
+            for future in as_completed(futures):
+                slot, filename = futures[future]
+                results[slot] = _indexing_result(future, filename)
+    
+    total_files_parsed = sum(r['stats']['files_parsed'] for r in results if r.get('success'))
+    total_chunks_created = sum(r['stats']['chunks_created'] for r in results if r.get('success'))
+    
+    successful = [r for r in results if r.get('success')]
+    failed = [r for r in results if not r.get('success')]
+    # index_document drops a source's old chunks before adding new ones, so even a failed re-index
+    # can leave cached answers citing chunks that are gone
+    if to_index:
+        clear_ask_cache()
+    
+    return {
+        'success': len(successful) > 0,
+        'files_parsed': total_files_parsed,
+        'chunks_created': total_chunks_created,
+        'indexed': True,
+        'results': results,
+        'summary': {
+            'total_files': total_files,
+            'successful': len(successful),
+            'failed': len(failed)
+        }
+    }
+
+
+def _run_index_job(job_id, results, to_index, tag, total_files):
+    """Background worker body for one upload: index its files and record the outcome on the job."""
+    with _index_jobs_lock:
+        if job_id in _index_jobs:
+            _index_jobs[job_id]['status'] = 'running'
+    try:
+        payload = _index_uploads(results, to_index, tag, total_files)
+        update = {'status': 'finished', 'result': payload}
+    except Exception as e:
+        update = {'status': 'failed', 'error': f'I had trouble processing these files: {str(e)}'}
+    with _index_jobs_lock:
+        if job_id in _index_jobs:
+            _index_jobs[job_id].update(update)
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Save uploaded file(s), run them through the RAG pipeline, and return indexing stats."""
-    if 'file' not in request.files:
+    """Save uploaded file(s) and queue them for indexing; returns 202 with a job_id to poll."""
+    if request.mimetype != 'multipart/form-data':
         return jsonify({'error': 'Please select a file to upload'}), 400
     
-    files = request.files.getlist('file')
-    source_tag = request.form.get('source_tag', '').strip()
-    reindex_all = request.form.get('reindex_all', 'false').lower() == 'true'
+    # Parse the multipart body ourselves so file bytes go straight to disk instead of through request.files
+    upload_target = _UploadTarget(app.config['UPLOAD_FOLDER'])
+    source_tag_target = ValueTarget()
+    reindex_all_target = ValueTarget()
+    try:
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register('file', upload_target)
+        parser.register('source_tag', source_tag_target)
+        parser.register('reindex_all', reindex_all_target)
+        while True:
+            chunk = request.stream.read(UPLOAD_READ_SIZE)
+            if not chunk:
+                break
+            parser.data_received(chunk)
+    except ParseFailedException as e:
+        return jsonify({'error': f'I couldn\'t read that upload: {str(e)}'}), 400
+    except ClientDisconnected:
+        return jsonify({'error': 'I couldn\'t read that upload: the connection closed before it finished'}), 400
+    finally:
+        upload_target.discard_partial()
     
-    if not files or all(f.filename == '' for f in files):
+    files = upload_target.files
+    source_tag = source_tag_target.value.decode('utf-8', errors='replace').strip()
+    reindex_all = reindex_all_target.value.decode('utf-8', errors='replace').lower() == 'true'
+    
+    if not files:
+        return jsonify({'error': 'Please select a file to upload'}), 400
+    
+    if all(f['original'] == '' for f in files):
         return jsonify({'error': 'Please select at least one file to upload'}), 400
     
+    tag = source_tag if source_tag else None
     results = []
-    total_files_parsed = 0
-    total_chunks_created = 0
+    to_index = []
     
     for file in files:
-        if file.filename == '':
+        if file['original'] == '':
             continue
             
-        if not allowed_file(file.filename):
+        if not allowed_file(file['original']):
             results.append({
-                'filename': file.filename,
+                'filename': file['original'],
                 'success': False,
                 'error': f'I can only process files in these formats: {", ".join(ALLOWED_EXTENSIONS)}. Please upload a file with one of these extensions.'
             })
             continue
         
-        try:
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            tag = source_tag if source_tag else None
-            
-            try:
-                stats = index_document(filepath, source_tag=tag)
-                total_files_parsed += stats['files_parsed']
-                total_chunks_created += stats['chunks_created']
-                results.append({
-                    'filename': filename,
-                    'success': True,
-                    'stats': stats
-                })
-            except ImportError as e:
-                results.append({
-                    'filename': filename,
-                    'success': False,
-                    'error': str(e),
-                    'hint': 'Install missing dependency: pip install pypdf (for PDF) or beautifulsoup4 (for HTML)'
-                })
-            except ValueError as e:
-                results.append({
-                    'filename': filename,
-                    'success': False,
-                    'error': str(e)
-                })
-            except FileNotFoundError as e:
-                results.append({
-                    'filename': filename,
-                    'success': False,
-                    'error': str(e)
-                })
-        except Exception as e:
+        if not file['filepath']:
+            error = file.get('error') or f'Invalid filename: {file["original"]}'
             results.append({
-                'filename': file.filename,
+                'filename': file['original'],
                 'success': False,
-                'error': f'I had trouble processing this file: {str(e)}'
+                'error': f'I had trouble processing this file: {error}'
             })
+            continue
+        
+        to_index.append((len(results), file['filename'], file['filepath']))
+        results.append(None)
     
-    successful = [r for r in results if r.get('success')]
-    failed = [r for r in results if not r.get('success')]
+    if not to_index:
+        return jsonify(_index_uploads(results, to_index, tag, len(files)))
+    
+    cache.delete('list_files')
+    job_id = uuid.uuid4().hex
+    with _index_jobs_lock:
+        done = [jid for jid, job in _index_jobs.items() if job['status'] in ('finished', 'failed')]
+        for jid in done[:max(0, len(_index_jobs) + 1 - MAX_TRACKED_JOBS)]:
+            del _index_jobs[jid]
+        _index_jobs[job_id] = {'status': 'queued', 'result': None, 'error': None}
+    _index_executor.submit(_run_index_job, job_id, results, to_index, tag, len(files))
     
     return jsonify({
-        'success': len(successful) > 0,
-        'files_parsed': total_files_parsed,
-        'chunks_created': total_chunks_created,
-        'indexed': True,
-        'results': results,
-        'summary': {
-            'total_files': len(files),
-            'successful': len(successful),
-            'failed': len(failed)
-        }
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'files': [filename for _, filename, _ in to_index]
+    }), 202
+
+
+@app.route('/api/upload/status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Report a background indexing job's status, and the upload result once it has finished."""
+    with _index_jobs_lock:
+        job = _index_jobs.get(job_id)
+        job = dict(job) if job else None
+    if job is None:
+        return jsonify({'error': 'I couldn\'t find that upload. It may have expired, please upload again.'}), 404
+    return jsonify({
+        'success': job['status'] != 'failed',
+        'job_id': job_id,
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error']
     })
 
 
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
     """Take a question, run RAG, return answer plus citations and retrieved chunks."""
-    data = request.get_json()
+    data = _json_body()
     question = data.get('question', '').strip()
     top_k = int(data.get('top_k', 5))
     retrieval_mode = data.get('retrieval_mode', 'hybrid')
@@ -176,17 +424,18 @@ def ask_question():
     if not question:
         return jsonify({'error': 'Please ask a question'}), 400
     
+    # Anything other than 'hybrid' means vector-only, so key on the flag rather than the raw client value
+    use_hybrid = (retrieval_mode == 'hybrid')
+    cache_key = (question.lower(), top_k, use_hybrid)
+    with _ask_cache_lock:
+        cached = _ask_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+    
     try:
-        use_hybrid = (retrieval_mode == 'hybrid')
+        # One call retrieves and answers; its chunks are reused for the preview below
         result = answer_with_citations(question, top_k=top_k, use_hybrid=use_hybrid)
-        
-        from app.rag import retrieve_chunks
-        documents, metadatas = retrieve_chunks(
-            question, 
-            top_k=top_k, 
-            use_hybrid=use_hybrid, 
-            rerank=True
-        )
+        documents, metadatas = result['documents'], result['metadatas']
         
         retrieved_chunks = []
         for doc, meta in zip(documents[:top_k], metadatas[:top_k]):
@@ -198,20 +447,31 @@ def ask_question():
                 'text': doc[:500]
             })
         
-        return jsonify({
+        payload = {
             'success': True,
             'answer': result['answer'],
             'citations': result['citations'],
             'retrieved_chunks': retrieved_chunks
-        })
+        }
+        with _ask_cache_lock:
+            _ask_cache[cache_key] = payload
+        return jsonify(payload)
     except Exception as e:
         return jsonify({'error': f'I encountered an error while processing your question: {str(e)}'}), 500
 
 
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Admin hook: empty the answer cache and the query-embedding cache."""
+    clear_ask_cache()
+    clear_query_caches()
+    return jsonify({'success': True, 'message': 'Caches cleared'})
+
+
 @app.route('/api/memory', methods=['POST'])
 def add_memory():
     """Parse user text for memory signals and append to USER_MEMORY.md / COMPANY_MEMORY.md."""
-    data = request.get_json(silent=True) or {}
+    data = _json_body()
     user_input = (data.get('input') or '').strip()
     
     if not user_input:
@@ -220,7 +480,6 @@ def add_memory():
     try:
         decisions = analyze_memory_signal(user_input)
         if not decisions and user_input:
-            from app.memory import _looks_sensitive
             if not _looks_sensitive(user_input):
                 decisions = [{
                     "should_write": True,
@@ -229,6 +488,8 @@ def add_memory():
                     "confidence": 0.8
                 }]
         memory_writes = persist_memory(decisions)
+        if memory_writes:
+            cache.delete('view_memory')
         return jsonify({
             'success': True,
             'memory_writes': memory_writes,
@@ -240,14 +501,12 @@ def add_memory():
 
 
 @app.route('/api/memory/view', methods=['GET'])
+@cache.cached(timeout=60, key_prefix='view_memory', response_filter=_cache_ok)
 def view_memory():
     """Return the current contents of both memory files for the UI to show."""
     try:
-        user_memory = Path('USER_MEMORY.md')
-        company_memory = Path('COMPANY_MEMORY.md')
-        
-        user_content = user_memory.read_text(encoding='utf-8') if user_memory.exists() else '# Memory Log\n\n'
-        company_content = company_memory.read_text(encoding='utf-8') if company_memory.exists() else '# Memory Log\n\n'
+        user_content = read_memory_text(USER_MEMORY_FILE)
+        company_content = read_memory_text(COMPANY_MEMORY_FILE)
         
         return jsonify({
             'success': True,
@@ -259,11 +518,12 @@ def view_memory():
 
 
 @app.route('/api/files', methods=['GET'])
+@cache.cached(timeout=60, key_prefix='list_files', response_filter=_cache_ok)
 def list_files():
     """List filenames in the uploads folder so the UI knows what's indexed."""
     try:
-        upload_dir = Path(app.config['UPLOAD_FOLDER'])
-        files = [f.name for f in upload_dir.iterdir() if f.is_file() and allowed_file(f.name)]
+        with os.scandir(app.config['UPLOAD_FOLDER']) as it:
+            files = [e.name for e in it if e.is_file(follow_symlinks=False) and allowed_file(e.name)]
         return jsonify({'success': True, 'files': files})
     except Exception as e:
         return jsonify({'error': f'Error listing files: {str(e)}'}), 500
@@ -274,6 +534,15 @@ if __name__ == '__main__':
     
     port = int(os.environ.get('PORT', 5001))
     
+    if os.environ.get('PRODUCTION') == '1':
+        # One threaded worker: the Chroma collection, BM25 index and upload jobs live in this process,
+        # so a second worker would not see documents indexed by the first
+        print(f"🚀 Starting gunicorn (gthread) on http://127.0.0.1:{port}")
+        os.execv(sys.executable, [
+            sys.executable, '-m', 'gunicorn', '-k', 'gthread', '-w', '1', '--threads', '8',
+            '-b', f'127.0.0.1:{port}', 'wsgi:app'
+        ])
+    
     print("=" * 60)
     print("🚀 Starting Agentic RAG Chatbot Web App")
     print("=" * 60)
@@ -0,0 +1,2 @@
+"""WSGI entrypoint for gunicorn: gunicorn -k gthread -w 1 --threads 8 wsgi:app"""
+from app.web import app  # noqa: F401